@@ -5,9 +5,12 @@
 """
 from pydantic_settings import BaseSettings 
 from pydantic import Field
-from typing import Dict, Optional
+from typing import Dict, Mapping, Optional, Tuple
+from types import MappingProxyType
 import os
 
+import orjson
+
 
 class Settings(BaseSettings):
     """应用配置"""
@@ -19,11 +22,18 @@ class Settings(BaseSettings):
     
     # 数据库配置
     db_path: str = Field(default="gesture_logs.db", env="DB_PATH")
+    db_pool_size: int = Field(default=5, env="DB_POOL_SIZE")
+    db_driver: str = Field(default="aiosqlite", env="DB_DRIVER")  # aiosqlite | rapsqlite
     
     # 文件存储配置
     output_dir: str = Field(default="outputs", env="OUTPUT_DIR")
+    max_output_files: int = Field(default=500, env="MAX_OUTPUT_FILES")
     max_file_size: int = Field(default=10 * 1024 * 1024, env="MAX_FILE_SIZE")
     
+    # 图像处理配置
+    use_opencl: bool = Field(default=True, env="USE_OPENCL")
+    use_cuda: bool = Field(default=True, env="USE_CUDA")
+    
     # CORS配置
     cors_origins: list = Field(
         default=["http://localhost:5173", "http://127.0.0.1:5173"],
@@ -37,6 +47,10 @@ class Settings(BaseSettings):
     # 性能配置
     log_retention_days: int = Field(default=30, env="LOG_RETENTION_DAYS")
     max_log_entries: int = Field(default=10000, env="MAX_LOG_ENTRIES")
+    log_queue_size: int = Field(default=10000, env="LOG_QUEUE_SIZE")
+    log_batch_size: int = Field(default=500, env="LOG_BATCH_SIZE")
+    log_flush_ms: int = Field(default=50, env="LOG_FLUSH_MS")
+    log_min_score: float = Field(default=0.0, env="LOG_MIN_SCORE")
     
     # ✅ 新增：数据分析配置
     analytics_cache_seconds: int = Field(default=60, env="ANALYTICS_CACHE_SECONDS")
@@ -75,24 +89,54 @@ class RuntimeConfig:
     
     def __init__(self):
         self.debounce_sec: float = settings.debounce_sec
-        self.mapping: Dict[str, str] = settings.default_gesture_mapping.copy()
+        # 映射采用写时复制：更新时生成新字典再替换引用，已发布的字典不再修改，
+        # 因此可以直接共享默认映射而无需拷贝；对外只暴露只读视图
+        self._mapping: Dict[str, str] = settings.default_gesture_mapping
+        self.mapping: Mapping[str, str] = MappingProxyType(self._mapping)
         self.enabled: bool = True
+        # 置信度低于该值的手势事件不写日志
+        self.log_min_score: float = settings.log_min_score
+        # 供热路径读取的 (防抖时间, 映射, 日志最低置信度) 快照，更新时整体替换
+        self.snapshot: Tuple[float, Dict[str, str], float]
+        # GET /api/config、/api/mapping 的响应体，配置变化时重新序列化
+        self.config_json: bytes
+        self.mapping_json: bytes
+        self._publish()
     
     def update_debounce(self, value: float) -> None:
         """更新防抖时间"""
         if 0.1 <= value <= 2.0:
             self.debounce_sec = value
+            self._publish()
+    
+    def update_log_min_score(self, value: float) -> None:
+        """更新写日志的最低置信度"""
+        if 0.0 <= value <= 1.0:
+            self.log_min_score = value
+            self._publish()
     
     def update_mapping(self, new_mapping: Dict[str, str]) -> None:
-        """更新手势映射"""
-        self.mapping.update(new_mapping)
+        """更新手势映射（键统一转为大写；生成新字典，不修改正在被读取的旧映射）"""
+        mapping = {**self._mapping}
+        for k, v in new_mapping.items():
+            mapping[str(k).upper()] = str(v)
+        self._mapping = mapping
+        self.mapping = MappingProxyType(mapping)
+        self._publish()
+    
+    def _publish(self) -> None:
+        """重建快照及缓存的JSON，单次赋值在GIL下是原子的，读者不会看到更新到一半的状态"""
+        self.snapshot = (self.debounce_sec, self._mapping, self.log_min_score)
+        self.config_json = orjson.dumps(self.to_dict())
+        self.mapping_json = orjson.dumps(self._mapping)
     
     def to_dict(self) -> dict:
         """转换为字典"""
         return {
             "debounce_sec": self.debounce_sec,
-            "mapping": self.mapping,
+            "mapping": dict(self.mapping),
             "enabled": self.enabled,
+            "log_min_score": self.log_min_score,
         }
 
 
@@ -7,23 +7,36 @@
 - 使用频率分析
 - 响应时间分析
 """
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response, JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
-from contextlib import asynccontextmanager
+from typing import List, Optional, Dict, Any, Tuple
+from contextlib import asynccontextmanager, suppress
 import time
 import sqlite3
 import csv
 import io
 import os
 import asyncio
+import functools
+import itertools
+import threading
+from collections import deque
 from datetime import datetime, timedelta
 import logging
 
+import aiosqlite
+import orjson
 import numpy as np
 import cv2
+from aiosqlitepool import SQLiteConnectionPool
+
+try:
+    import rapsqlite
+except ImportError:
+    rapsqlite = None
 
 from config import settings, runtime_config
 
@@ -48,6 +61,7 @@ class ConfigUpdate(BaseModel):
     """配置更新模型"""
     debounce_sec: Optional[float] = Field(None, ge=0.1, le=2.0)
     mapping: Optional[Dict[str, str]] = None
+    log_min_score: Optional[float] = Field(None, ge=0.0, le=1.0)
 
 
 class HealthResponse(BaseModel):
@@ -63,6 +77,12 @@ class HealthResponse(BaseModel):
 # ==================== 全局状态 ====================
 class AppState:
     """应用状态管理"""
+    # 固定属性集合，属性读写走槽位描述符，不经过实例 __dict__
+    __slots__ = (
+        "start_time", "mode", "last_gesture", "last_command", "updated_at",
+        "last_trigger_gesture", "last_trigger_t",
+        "total_requests", "fps_history", "_fps_sum", "error_count", "total_logs",
+    )
     
     def __init__(self):
         self.start_time = time.time()
@@ -70,12 +90,17 @@ class AppState:
         self.last_gesture = "-"
         self.last_command = "-"
         self.updated_at = time.time()
-        self.last_trigger = {"gesture": None, "t": 0.0}
+        # 上次触发的手势及其 time.monotonic() 时刻，用于防抖
+        self.last_trigger_gesture: Optional[str] = None
+        self.last_trigger_t = float("-inf")
         
         # 性能统计
         self.total_requests = 0
-        self.fps_history = []
+        self.fps_history = deque(maxlen=100)
+        self._fps_sum = 0.0
         self.error_count = 0
+        # 日志总数：启动时统计一次，之后由写入任务累加、清理任务扣减
+        self.total_logs = 0
     
     def update_gesture(self, gesture: str, command: str):
         """更新手势状态"""
@@ -99,13 +124,15 @@ class AppState:
         """获取平均FPS"""
         if not self.fps_history:
             return 0.0
-        return sum(self.fps_history) / len(self.fps_history)
+        return self._fps_sum / len(self.fps_history)
     
     def add_fps(self, fps: float):
         """添加FPS记录"""
+        # 队列已满时append会挤出最早的记录，先从累计和中扣除
+        if len(self.fps_history) == self.fps_history.maxlen:
+            self._fps_sum -= self.fps_history[0]
         self.fps_history.append(fps)
-        if len(self.fps_history) > 100:
-            self.fps_history.pop(0)
+        self._fps_sum += fps
     
     def to_dict(self) -> dict:
         """转换为字典"""
@@ -121,11 +148,77 @@ class AppState:
 
 app_state = AppState()
 
+
+class _AnalyticsCache:
+    """分析结果缓存（日志写入或清理后数据版本递增，旧结果随之失效）"""
+    version: int = 0
+    entries: Dict[tuple, Tuple[int, float, bytes]] = {}
+    max_entries: int = 128
+
+
+def analytics_cached(func):
+    """按函数名+查询参数缓存分析结果，有效期 analytics_cache_seconds 秒且数据版本不变"""
+    @functools.wraps(func)
+    async def wrapper(**kwargs):
+        key = (func.__name__, *sorted(kwargs.items()))
+        version = _AnalyticsCache.version
+        now = time.time()
+        cached = _AnalyticsCache.entries.get(key)
+        if cached is not None and cached[0] == version and now < cached[1]:
+            # 缓存的是序列化后的JSON字节，命中时不再编码；每次构造新响应，避免中间件改写共享的响应头
+            return Response(cached[2], media_type="application/json")
+        
+        result = await func(**kwargs)
+        if len(_AnalyticsCache.entries) >= _AnalyticsCache.max_entries:
+            _AnalyticsCache.entries.clear()
+        # 记录计算开始时的版本，计算期间有新写入时下次请求会重新计算
+        _AnalyticsCache.entries[key] = (version, now + settings.analytics_cache_seconds, result.body)
+        return result
+    return wrapper
+
 # ==================== 数据库操作 ====================
+# 热路径SQL定义为模块常量，长连接上的语句缓存可直接复用已编译的语句
+INSERT_LOG_SQL = (
+    "INSERT INTO logs(time, gesture, command, score, response_time, session_id, is_correct) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+# logs 是rowid表，数据B树本身按id有序，ORDER BY id DESC LIMIT 直接倒序读取，无需额外的覆盖索引
+SELECT_LOGS_SQL = (
+    "SELECT id, time, gesture, command, score, created_at, response_time, session_id, is_correct "
+    "FROM logs ORDER BY id DESC LIMIT ?"
+)
+# 导出最近的N条日志，按时间正序输出
+EXPORT_LOGS_SQL = (
+    "SELECT time, gesture, command, score, response_time, session_id FROM "
+    "(SELECT * FROM logs ORDER BY id DESC LIMIT ?) ORDER BY id ASC"
+)
+# 过期日志按批删除
+CLEANUP_LOGS_SQL = (
+    "DELETE FROM logs WHERE id IN (SELECT id FROM logs WHERE time < ? LIMIT ?)"
+)
+CLEANUP_BATCH_ROWS = 1000
+# CSV导出每批读取的行数，以及攒够多少字节再输出一个响应块
+CSV_FETCH_ROWS = 500
+CSV_CHUNK_BYTES = 64 * 1024
+
+# 连接级PRAGMA：WAL + NORMAL同步使提交不再逐次fsync，fsync推迟到检查点
+SQLITE_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+    # WAL达到1000页时自动检查点（与SQLite默认值一致，显式设置避免被编译选项改变）
+    "PRAGMA wal_autocheckpoint=1000",
+)
+
+
 def get_db_connection():
-    """获取数据库连接"""
+    """获取数据库连接（与连接池使用相同的PRAGMA设置）"""
     conn = sqlite3.connect(settings.db_path, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
 
@@ -136,6 +229,13 @@ def init_database():
         conn = get_db_connection()
         cursor = conn.cursor()
         
+        # WAL模式写入数据库文件后持久生效，部分文件系统不支持时会保持原模式
+        journal_mode = cursor.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+        if journal_mode.lower() == "wal":
+            logger.info("数据库日志模式: WAL")
+        else:
+            logger.warning(f"数据库未能启用WAL，当前日志模式: {journal_mode}")
+        
         # 创建表（包含所有字段）
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS logs (
@@ -147,14 +247,43 @@ def init_database():
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 response_time REAL DEFAULT 0.0,
                 session_id TEXT DEFAULT 'default',
-                is_correct INTEGER DEFAULT 1
+                is_correct INTEGER DEFAULT 1,
+                hour_bucket INTEGER GENERATED ALWAYS AS (CAST(time / 3600 AS INTEGER)) VIRTUAL
             )
         """)
         
-        # 创建索引
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_time ON logs(time DESC)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_gesture ON logs(gesture)")
+        columns = [col[1] for col in cursor.execute("PRAGMA table_xinfo(logs)").fetchall()]
+        # 经 upgrade_database.py 升级的旧库没有 created_at，SELECT_LOGS_SQL 需要该列
+        if "created_at" not in columns:
+            cursor.execute("ALTER TABLE logs ADD COLUMN created_at TIMESTAMP")
+        # 旧库补充小时桶生成列（VIRTUAL列不占存储，只有索引中保存计算结果）
+        if "hour_bucket" not in columns:
+            cursor.execute(
+                "ALTER TABLE logs ADD COLUMN hour_bucket INTEGER "
+                "GENERATED ALWAYS AS (CAST(time / 3600 AS INTEGER)) VIRTUAL"
+            )
+        
+        # 创建索引：time/gesture 使用覆盖索引，分析查询可只扫索引不回表
+        cursor.execute("DROP INDEX IF EXISTS idx_logs_time")
+        cursor.execute("DROP INDEX IF EXISTS idx_logs_gesture")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_logs_time_cov "
+            "ON logs(time, score, response_time)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_logs_gesture_cov "
+            "ON logs(gesture, is_correct, score, response_time)"
+        )
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_session ON logs(session_id)")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_logs_hour "
+            "ON logs(hour_bucket, score, response_time)"
+        )
+        conn.commit()
+        
+        # 更新统计信息供查询规划器选择索引，analysis_limit 限制大表上的采样开销
+        cursor.execute("PRAGMA analysis_limit=1000")
+        cursor.execute("ANALYZE")
         
         conn.commit()
         conn.close()
@@ -164,7 +293,24 @@ def init_database():
         raise
 
 
-async def insert_log_async(
+async def create_db_connection() -> aiosqlite.Connection:
+    """创建连接池使用的数据库连接（DB_DRIVER=rapsqlite 且已安装时使用rapsqlite）"""
+    if settings.db_driver == "rapsqlite" and rapsqlite is not None:
+        # session_affinity 保证下面的PRAGMA作用于同一个底层会话
+        conn = await rapsqlite.connect(
+            settings.db_path, aiosqlite_compat=True, session_affinity=True
+        )
+        conn.row_factory = rapsqlite.Row
+    else:
+        conn = await aiosqlite.connect(settings.db_path)
+        conn.row_factory = aiosqlite.Row
+    await conn.execute("PRAGMA journal_mode=WAL")
+    for pragma in SQLITE_PRAGMAS:
+        await conn.execute(pragma)
+    return conn
+
+
+def enqueue_log(
     t: float, 
     gesture: str, 
     command: str, 
@@ -173,92 +319,116 @@ async def insert_log_async(
     session_id: str = "default",
     is_correct: int = 1
 ):
-    """异步插入日志"""
+    """日志入队，由后台写入任务批量落库"""
     try:
-        await asyncio.to_thread(
-            _insert_log_sync, t, gesture, command, score, 
-            response_time, session_id, is_correct
+        app.state.log_queue.put_nowait(
+            (t, gesture, command, score, response_time, session_id, is_correct)
         )
-    except Exception as e:
-        logger.error(f"日志插入失败: {e}")
+    except asyncio.QueueFull:
+        logger.warning("日志队列已满，丢弃日志")
         app_state.error_count += 1
 
 
-def _insert_log_sync(
-    t: float, 
-    gesture: str, 
-    command: str, 
-    score: float,
-    response_time: float,
-    session_id: str,
-    is_correct: int
-):
-    """同步插入日志"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        """INSERT INTO logs(time, gesture, command, score, response_time, session_id, is_correct) 
-           VALUES (?, ?, ?, ?, ?, ?, ?)""",
-        (t, gesture, command, score, response_time, session_id, is_correct)
-    )
-    conn.commit()
-    conn.close()
+async def log_writer(queue: asyncio.Queue, conn: aiosqlite.Connection):
+    """
+    后台日志写入任务：合并多条日志后一次事务批量插入
+    独占一条写连接，不占用连接池，查询请求不会与写入争用连接
+    """
+    loop = asyncio.get_running_loop()
+    flush_sec = settings.log_flush_ms / 1000
+    
+    while True:
+        batch = [await queue.get()]
+        deadline = loop.time() + flush_sec
+        
+        # 凑满一批或等待超时后写入
+        while len(batch) < settings.log_batch_size:
+            try:
+                batch.append(queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        
+        try:
+            # 事务开始即获取写锁，避免读锁升级为写锁时的SQLITE_BUSY
+            await conn.execute("BEGIN IMMEDIATE")
+            await conn.executemany(INSERT_LOG_SQL, batch)
+            await conn.commit()
+            app_state.total_logs += len(batch)
+            _AnalyticsCache.version += 1
+        except Exception as e:
+            logger.error(f"日志批量写入失败({len(batch)}条): {e}")
+            app_state.error_count += 1
+            with suppress(Exception):
+                await conn.rollback()
+        finally:
+            for _ in batch:
+                queue.task_done()
 
 
 async def get_logs_async(limit: int = 50) -> List[dict]:
     """异步获取日志"""
     try:
-        return await asyncio.to_thread(_get_logs_sync, limit)
+        async with app.state.db_pool.connection() as conn:
+            # execute_fetchall 在驱动线程内一次完成查询和取数，省去一次线程往返
+            rows = await conn.execute_fetchall(SELECT_LOGS_SQL, (limit,))
+        return [dict(row) for row in rows]
     except Exception as e:
         logger.error(f"日志查询失败: {e}")
         return []
 
 
-def _get_logs_sync(limit: int) -> List[dict]:
-    """同步获取日志"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT * FROM logs ORDER BY id DESC LIMIT ?",
-        (limit,)
-    )
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
-
-
 async def cleanup_old_logs():
     """清理过期日志"""
     try:
         cutoff_time = time.time() - (settings.log_retention_days * 86400)
-        await asyncio.to_thread(_cleanup_logs_sync, cutoff_time)
+        deleted = 0
+        # 分批删除，每批单独提交并归还连接，避免长时间持有写锁阻塞日志写入
+        while True:
+            async with app.state.db_pool.connection() as conn:
+                cursor = await conn.execute(
+                    CLEANUP_LOGS_SQL, (cutoff_time, CLEANUP_BATCH_ROWS)
+                )
+                await conn.commit()
+            if cursor.rowcount <= 0:
+                break
+            deleted += cursor.rowcount
+            app_state.total_logs -= cursor.rowcount
+            await asyncio.sleep(0)
+        
+        async with app.state.db_pool.connection() as conn:
+            # 长期运行的进程定期执行 optimize，只重新分析统计信息明显过时的表/索引；
+            # 它可能写入 sqlite_stat1，须在检查点之前执行，否则新写入的页又留在WAL中
+            await conn.execute("PRAGMA optimize")
+            # 清理后做一次截断式检查点，把WAL文件收缩回0字节；有长时间读事务时可能只完成部分
+            cursor = await conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            busy, wal_pages, checkpointed = await cursor.fetchone()
+        if busy:
+            logger.warning(f"WAL检查点未完成: {checkpointed}/{wal_pages} 页")
+        _AnalyticsCache.version += 1
+        logger.info(f"清理了 {deleted} 条过期日志")
         logger.info("日志清理完成")
     except Exception as e:
         logger.error(f"日志清理失败: {e}")
 
 
-def _cleanup_logs_sync(cutoff_time: float):
-    """同步清理日志"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM logs WHERE time < ?", (cutoff_time,))
-    deleted = cursor.rowcount
-    conn.commit()
-    conn.close()
-    logger.info(f"清理了 {deleted} 条过期日志")
+async def load_log_count():
+    """启动时统计一次日志总数（COUNT(*) 需全表扫描，此后只维护计数器）"""
+    async with app.state.db_pool.connection() as conn:
+        cursor = await conn.execute("SELECT COUNT(*) FROM logs")
+        app_state.total_logs = (await cursor.fetchone())[0]
 
 
 def get_log_count() -> int:
-    """获取日志总数"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM logs")
-        count = cursor.fetchone()[0]
-        conn.close()
-        return count
-    except:
-        return 0
+    """获取日志总数（O(1)，读取内存计数器）"""
+    return app_state.total_logs
 
 
 # ==================== 应用生命周期 ====================
@@ -267,9 +437,39 @@ async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     logger.info(f"启动 {settings.app_title} v{settings.app_version}")
     init_database()
+    load_output_files()
+    await rotate_output_files()
+    if settings.db_driver == "rapsqlite" and rapsqlite is None:
+        logger.warning("未安装 rapsqlite，数据库驱动回退为 aiosqlite")
+    # 显式启用SIMD优化内核（默认开启，可能被其他库或环境关闭）
+    cv2.setUseOptimized(True)
+    cv2.ocl.setUseOpenCL(settings.use_opencl)
+    logger.info(f"OpenCV OpenCL加速: {'启用' if cv2.ocl.useOpenCL() else '未启用'}")
+    init_cuda_pipeline()
+    app.state.db_pool = SQLiteConnectionPool(
+        create_db_connection,
+        pool_size=settings.db_pool_size
+    )
+    app.state.log_queue = asyncio.Queue(maxsize=settings.log_queue_size)
+    await load_log_count()
+    writer_conn = await create_db_connection()
+    writer_task = asyncio.create_task(log_writer(app.state.log_queue, writer_conn))
     asyncio.create_task(periodic_cleanup())
     yield
     logger.info("应用正在关闭...")
+    # 等待队列中剩余日志写入完成
+    await app.state.log_queue.join()
+    writer_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await writer_task
+    # 关闭前刷新查询规划器统计信息并收缩WAL，下次启动无需回放WAL（optimize 会写库，须在检查点之前）
+    try:
+        await writer_conn.execute("PRAGMA optimize")
+        await writer_conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    except Exception as e:
+        logger.warning(f"关闭前数据库维护失败: {e}")
+    await writer_conn.close()
+    await app.state.db_pool.close()
 
 
 async def periodic_cleanup():
@@ -283,9 +483,46 @@ async def periodic_cleanup():
 app = FastAPI(
     title=settings.app_title,
     version=settings.app_version,
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
+# multipart边界、字段头等开销的余量
+UPLOAD_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadSizeLimitMiddleware:
+    """
+    图像上传的 Content-Length 超过 max_file_size 时直接返回413，不接收请求体
+    表单在进入端点前就会被完整解析，端点内的大小检查只能兜底未声明长度的分块上传
+    """
+    
+    def __init__(self, app, path: str, max_bytes: int):
+        self.app = app
+        self.path = path
+        self.max_bytes = max_bytes
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == self.path:
+            for name, value in scope["headers"]:
+                if name == b"content-length":
+                    if not value.isdigit():
+                        response = ORJSONResponse({"detail": "Content-Length 无效"}, status_code=400)
+                    elif int(value) > self.max_bytes:
+                        response = ORJSONResponse({"detail": "文件过大"}, status_code=413)
+                    else:
+                        break
+                    await response(scope, receive, send)
+                    return
+        await self.app(scope, receive, send)
+
+
+# 后添加的中间件在外层：先注册上传大小检查，使413响应同样经过CORS处理
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    path="/api/frame/preprocess",
+    max_bytes=settings.max_file_size + UPLOAD_OVERHEAD_BYTES,
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.cors_origins,
@@ -293,6 +530,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 日志列表、CSV导出等重复度高的响应压缩传输；小于1KB的响应（如手势事件）不压缩
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 
 # ==================== 异常处理 ====================
@@ -301,13 +540,15 @@ async def global_exception_handler(request, exc):
     """全局异常处理"""
     logger.error(f"未处理的异常: {exc}", exc_info=True)
     app_state.error_count += 1
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={"ok": False, "error": "Internal server error"}
     )
 
 
 # ==================== 基础API端点 ====================
+# 高频轮询的小接口直接返回 ORJSONResponse，跳过 jsonable_encoder / response_model 的逐字段处理；
+# response_model 仍保留用于生成接口文档
 @app.get("/api/health", response_model=HealthResponse)
 async def health_check():
     """健康检查"""
@@ -318,20 +559,20 @@ async def health_check():
         log_count = 0
         db_status = "error"
     
-    return HealthResponse(
-        status="healthy" if db_status == "ok" else "degraded",
-        version=settings.app_version,
-        uptime=app_state.get_uptime(),
-        db_status=db_status,
-        total_logs=log_count,
-        fps_avg=app_state.get_avg_fps()
-    )
+    return ORJSONResponse({
+        "status": "healthy" if db_status == "ok" else "degraded",
+        "version": settings.app_version,
+        "uptime": app_state.get_uptime(),
+        "db_status": db_status,
+        "total_logs": log_count,
+        "fps_avg": app_state.get_avg_fps(),
+    })
 
 
 @app.get("/api/config")
 async def get_config():
-    """获取当前配置"""
-    return runtime_config.to_dict()
+    """获取当前配置（返回配置更新时预先序列化的JSON）"""
+    return Response(runtime_config.config_json, media_type="application/json")
 
 
 @app.post("/api/config")
@@ -341,8 +582,10 @@ async def update_config(cfg: ConfigUpdate):
         runtime_config.update_debounce(cfg.debounce_sec)
     
     if cfg.mapping is not None:
-        new_mapping = {str(k).upper(): str(v) for k, v in cfg.mapping.items()}
-        runtime_config.update_mapping(new_mapping)
+        runtime_config.update_mapping(cfg.mapping)
+    
+    if cfg.log_min_score is not None:
+        runtime_config.update_log_min_score(cfg.log_min_score)
     
     logger.info(f"配置已更新")
     return {"ok": True, "config": runtime_config.to_dict()}
@@ -350,50 +593,101 @@ async def update_config(cfg: ConfigUpdate):
 
 @app.get("/api/mapping")
 async def get_mapping():
-    """获取手势映射"""
-    return runtime_config.mapping
+    """获取手势映射（返回映射更新时预先序列化的JSON）"""
+    return Response(runtime_config.mapping_json, media_type="application/json")
 
 
-@app.post("/api/gesture/event")
-async def post_gesture(ev: GestureEvent, background_tasks: BackgroundTasks):
+def parse_gesture_event(body: bytes) -> Tuple[str, float, float, str]:
+    """
+    快速解析手势事件请求体，字段校验规则与 GestureEvent 一致
+    手势名在此统一为大写，空字符串视为 UNKNOWN（GestureEvent 只用于OpenAPI文档，不做归一化）
+    返回：(gesture, score, response_time, session_id)
+    """
+    try:
+        data = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=422, detail="请求体不是合法的JSON")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=422, detail="请求体必须是JSON对象")
+    
+    gesture = data.get("gesture")
+    if not isinstance(gesture, str):
+        raise HTTPException(status_code=422, detail="gesture 必须是字符串")
+    try:
+        score = float(data.get("score", 1.0))
+        response_time = float(data.get("response_time") or 0.0)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=422, detail="score/response_time 必须是数字")
+    if not 0.0 <= score <= 1.0:
+        raise HTTPException(status_code=422, detail="score 必须在0到1之间")
+    session_id = data.get("session_id")
+    if session_id is not None and not isinstance(session_id, str):
+        raise HTTPException(status_code=422, detail="session_id 必须是字符串")
+    
+    gesture = gesture.upper() if gesture else "UNKNOWN"
+    return gesture, score, response_time, session_id or "default"
+
+
+# 请求体由 parse_gesture_event 手动解析，OpenAPI文档仍使用 GestureEvent 的结构
+@app.post(
+    "/api/gesture/event",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": GestureEvent.model_json_schema()}},
+        }
+    },
+)
+async def post_gesture(request: Request):
     """接收手势事件"""
+    gesture, score, response_time, session_id = parse_gesture_event(await request.body())
     try:
+        # 热路径：全局对象绑定为局部变量，减少属性查找
+        state = app_state
         now = time.time()
-        gesture = (ev.gesture or "UNKNOWN").upper()
-        command = runtime_config.mapping.get(gesture, "NONE")
-        debounce_sec = runtime_config.debounce_sec
+        debounce_sec, mapping, log_min_score = runtime_config.snapshot
+        command = mapping.get(gesture, "NONE")
         
-        # 防抖检查
-        last_trigger = app_state.last_trigger
-        if last_trigger["gesture"] == gesture and (now - last_trigger["t"]) < debounce_sec:
-            return {
+        # 防抖检查（被拦截时状态未变化，不再构造state字段）
+        # 防抖用单调时钟计时，不受系统时间调整影响
+        mono = time.monotonic()
+        if state.last_trigger_gesture == gesture and (mono - state.last_trigger_t) < debounce_sec:
+            return ORJSONResponse({
                 "accepted": False,
                 "reason": "debounced",
-                "command": command,
-                "state": app_state.to_dict()
-            }
+                "command": command
+            })
         
-        app_state.last_trigger = {"gesture": gesture, "t": now}
-        app_state.update_mode(command)
-        app_state.update_gesture(gesture, command)
+        state.last_trigger_gesture = gesture
+        state.last_trigger_t = mono
+        # 内联 AppState.update_mode / update_gesture（其他调用方仍可使用原方法）
+        if command == "START":
+            state.mode = "RUNNING"
+        elif command == "STOP":
+            state.mode = "STOPPED"
+        state.last_gesture = gesture
+        state.last_command = command
+        state.updated_at = now
+        state.total_requests += 1
         
-        # 异步写入日志（包含响应时间和会话ID）
-        background_tasks.add_task(
-            insert_log_async, 
-            now, 
-            gesture, 
-            command, 
-            float(ev.score),
-            float(ev.response_time or 0.0),
-            str(ev.session_id or "default"),
-            1  # is_correct 默认为1
-        )
+        # 日志入队，由后台任务批量写入（包含响应时间和会话ID）；
+        # 未映射的手势（NONE）和低于最低置信度的事件不记录
+        if command != "NONE" and score >= log_min_score:
+            enqueue_log(
+                now, 
+                gesture, 
+                command, 
+                score,
+                response_time,
+                session_id,
+                1  # is_correct 默认为1
+            )
         
-        return {
+        return ORJSONResponse({
             "accepted": True,
             "command": command,
-            "state": app_state.to_dict()
-        }
+            "state": state.to_dict()
+        })
     
     except Exception as e:
         logger.error(f"处理手势事件失败: {e}")
@@ -403,7 +697,7 @@ async def post_gesture(ev: GestureEvent, background_tasks: BackgroundTasks):
 @app.get("/api/status")
 async def get_status():
     """获取系统状态"""
-    return app_state.to_dict()
+    return ORJSONResponse(app_state.to_dict())
 
 
 @app.get("/api/logs")
@@ -411,97 +705,127 @@ async def get_logs(limit: int = 50):
     """获取日志记录"""
     limit = max(1, min(500, limit))
     logs = await get_logs_async(limit)
-    return logs
+    return ORJSONResponse(logs)
+
+
+def _csv_lines(rows: List[tuple]) -> Optional[str]:
+    """
+    用f-string直接拼接一批CSV行，省去 csv.writer 逐字段的类型判断与转义检查
+    文本字段含逗号、引号、换行或值为NULL时无法直接拼接，返回None交由 csv.writer 处理
+    """
+    text = "".join([f"{r[0]},{r[1]},{r[2]},{r[3]},{r[4]},{r[5]}\r\n" for r in rows])
+    n = len(rows)
+    # 数值字段不含这些字符，计数不符说明文本字段里有需要转义的内容
+    if (
+        '"' in text or "None" in text
+        or text.count(",") != 5 * n
+        or text.count("\n") != n or text.count("\r") != n
+    ):
+        return None
+    return text
+
+
+async def iter_logs_csv(limit: int):
+    """按批生成CSV内容：每次 fetchmany 取 CSV_FETCH_ROWS 行，缓冲区超过 CSV_CHUNK_BYTES 时输出一块"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["time", "gesture", "command", "score", "response_time", "session_id"])
+    yield buffer.getvalue().encode("utf-8-sig")
+    buffer.seek(0)
+    buffer.truncate()
+    
+    try:
+        async with app.state.db_pool.connection() as conn:
+            async with conn.execute(EXPORT_LOGS_SQL, (limit,)) as cursor:
+                while True:
+                    rows = await cursor.fetchmany(CSV_FETCH_ROWS)
+                    if not rows:
+                        break
+                    text = _csv_lines(rows)
+                    if text is None:
+                        writer.writerows(rows)
+                    else:
+                        buffer.write(text)
+                    if buffer.tell() >= CSV_CHUNK_BYTES:
+                        yield buffer.getvalue().encode("utf-8")
+                        buffer.seek(0)
+                        buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+    except Exception as e:
+        # 响应头已发出，只能中断传输；继续抛出让服务器断开连接，客户端不会把截断的文件当作完整导出
+        logger.error(f"日志导出失败: {e}")
+        raise
 
 
 @app.get("/api/logs/export.csv")
 async def export_csv(limit: int = 200):
     """导出CSV格式日志"""
     limit = max(1, min(2000, limit))
-    logs = await get_logs_async(limit)
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["time", "gesture", "command", "score", "response_time", "session_id"])
-    
-    for log in reversed(logs):
-        writer.writerow([
-            log.get("time", 0),
-            log.get("gesture", ""),
-            log.get("command", ""),
-            log.get("score", 0),
-            log.get("response_time", 0),
-            log.get("session_id", "default")
-        ])
-    
-    csv_bytes = output.getvalue().encode("utf-8-sig")
-    return Response(
-        content=csv_bytes,
+    return StreamingResponse(
+        iter_logs_csv(limit),
         media_type="text/csv",
         headers={"Content-Disposition": "attachment; filename=gesture_logs.csv"}
     )
 
 
 # ==================== ✅ 新增：数据分析API端点 ====================
+# 分析接口直接返回 ORJSONResponse，跳过 FastAPI 对返回值的 jsonable_encoder 逐项遍历
+
+# 置信度分布：SQL按原始score比较得到桶号5~9，桶号→区间名
+CONFIDENCE_BUCKET_LABELS = {9: "90-100%", 8: "80-90%", 7: "70-80%", 6: "60-70%", 5: "<60%"}
+# 响应时间分布：SQL按 50ms 分桶并截断到0~10，桶号(下标)→区间名
+RESPONSE_BUCKET_LABELS = (
+    ("<50ms", "50-100ms") + ("100-200ms",) * 2 + ("200-500ms",) * 6 + (">500ms",)
+)
 
 @app.get("/api/analytics/summary")
+@analytics_cached
 async def get_analytics_summary():
     """
     获取数据分析摘要
     返回：总体统计数据
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 1. 总识别次数
-        cursor.execute("SELECT COUNT(*) FROM logs")
-        total_count = cursor.fetchone()[0]
-        
-        # 2. 总体准确率
-        cursor.execute("SELECT AVG(is_correct) FROM logs")
-        accuracy_result = cursor.fetchone()[0]
-        overall_accuracy = float(accuracy_result) if accuracy_result else 0.0
-        
-        # 3. 平均响应时间
-        cursor.execute("SELECT AVG(response_time) FROM logs WHERE response_time > 0")
-        avg_response_result = cursor.fetchone()[0]
-        avg_response_time = float(avg_response_result) if avg_response_result else 0.0
-        
-        # 4. 平均置信度
-        cursor.execute("SELECT AVG(score) FROM logs")
-        avg_score_result = cursor.fetchone()[0]
-        avg_confidence = float(avg_score_result) if avg_score_result else 0.0
-        
-        # 5. 今日统计
         today_start = time.time() - 86400
-        cursor.execute("SELECT COUNT(*) FROM logs WHERE time > ?", (today_start,))
-        today_count = cursor.fetchone()[0]
-        
-        # 6. 本周统计
         week_start = time.time() - (86400 * 7)
-        cursor.execute("SELECT COUNT(*) FROM logs WHERE time > ?", (week_start,))
-        week_count = cursor.fetchone()[0]
         
-        # 7. 最常用的手势（TOP 3）
-        cursor.execute("""
-            SELECT gesture, COUNT(*) as count 
-            FROM logs 
-            WHERE gesture != 'UNKNOWN'
-            GROUP BY gesture 
-            ORDER BY count DESC 
-            LIMIT 3
-        """)
-        top_gestures = [{"gesture": row[0], "count": row[1]} for row in cursor.fetchall()]
+        async with app.state.db_pool.connection() as conn:
+            # 1-6, 8. 总数、准确率、响应时间、置信度、今日/本周数量、UNKNOWN数量：一次扫描完成
+            cursor = await conn.execute("""
+                SELECT 
+                    COUNT(*),
+                    AVG(is_correct),
+                    AVG(CASE WHEN response_time > 0 THEN response_time END),
+                    AVG(score),
+                    SUM(CASE WHEN time > ? THEN 1 ELSE 0 END),
+                    SUM(CASE WHEN time > ? THEN 1 ELSE 0 END),
+                    SUM(CASE WHEN gesture = 'UNKNOWN' THEN 1 ELSE 0 END)
+                FROM logs
+            """, (today_start, week_start))
+            stats = await cursor.fetchone()
+            
+            # 7. 最常用的手势（TOP 3）
+            cursor = await conn.execute("""
+                SELECT gesture, COUNT(*) as count 
+                FROM logs 
+                WHERE gesture != 'UNKNOWN'
+                GROUP BY gesture 
+                ORDER BY count DESC 
+                LIMIT 3
+            """)
+            top_gestures = [{"gesture": row[0], "count": row[1]} for row in await cursor.fetchall()]
         
-        # 8. UNKNOWN手势比例
-        cursor.execute("SELECT COUNT(*) FROM logs WHERE gesture = 'UNKNOWN'")
-        unknown_count = cursor.fetchone()[0]
+        total_count = stats[0]
+        overall_accuracy = float(stats[1]) if stats[1] else 0.0
+        avg_response_time = float(stats[2]) if stats[2] else 0.0
+        avg_confidence = float(stats[3]) if stats[3] else 0.0
+        today_count = stats[4] or 0
+        week_count = stats[5] or 0
+        unknown_count = stats[6] or 0
         unknown_rate = (unknown_count / total_count * 100) if total_count > 0 else 0.0
         
-        conn.close()
-        
-        return {
+        return ORJSONResponse({
             "total_recognitions": total_count,
             "today_recognitions": today_count,
             "week_recognitions": week_count,
@@ -511,7 +835,7 @@ async def get_analytics_summary():
             "unknown_rate": round(unknown_rate, 2),
             "top_gestures": top_gestures,
             "timestamp": datetime.now().isoformat()
-        }
+        })
     
     except Exception as e:
         logger.error(f"获取分析摘要失败: {e}")
@@ -519,57 +843,53 @@ async def get_analytics_summary():
 
 
 @app.get("/api/analytics/gestures")
+@analytics_cached
 async def get_gesture_analytics():
     """
     获取每个手势的详细统计
     返回：每个手势的识别次数、准确率、平均响应时间
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 获取每个手势的统计数据
-        cursor.execute("""
-            SELECT 
-                gesture,
-                COUNT(*) as total_count,
-                AVG(is_correct) as accuracy,
-                AVG(score) as avg_confidence,
-                AVG(response_time) as avg_response_time,
-                MIN(response_time) as min_response_time,
-                MAX(response_time) as max_response_time
-            FROM logs
-            GROUP BY gesture
-            ORDER BY total_count DESC
-        """)
-        
-        results = []
-        total_all = 0
-        
-        for row in cursor.fetchall():
-            gesture_data = {
-                "gesture": row[0],
-                "count": row[1],
-                "accuracy": round(float(row[2]) * 100, 2) if row[2] else 0.0,
-                "avg_confidence": round(float(row[3]) * 100, 2) if row[3] else 0.0,
-                "avg_response_time": round(float(row[4]), 2) if row[4] else 0.0,
-                "min_response_time": round(float(row[5]), 2) if row[5] else 0.0,
-                "max_response_time": round(float(row[6]), 2) if row[6] else 0.0,
-            }
-            results.append(gesture_data)
-            total_all += row[1]
-        
-        # 计算每个手势的使用频率百分比
-        for item in results:
-            item["percentage"] = round((item["count"] / total_all * 100), 2) if total_all > 0 else 0.0
-        
-        conn.close()
+        async with app.state.db_pool.connection() as conn:
+            # 获取每个手势的统计数据
+            cursor = await conn.execute("""
+                SELECT 
+                    gesture,
+                    COUNT(*) as total_count,
+                    AVG(is_correct) as accuracy,
+                    AVG(score) as avg_confidence,
+                    AVG(response_time) as avg_response_time,
+                    MIN(response_time) as min_response_time,
+                    MAX(response_time) as max_response_time,
+                    COUNT(*) * 100.0 / SUM(COUNT(*)) OVER () as percentage
+                FROM logs
+                GROUP BY gesture
+                ORDER BY total_count DESC
+            """)
+            
+            results = []
+            total_all = 0
+            
+            # 使用频率百分比由窗口函数在同一次查询中算出
+            for row in await cursor.fetchall():
+                gesture_data = {
+                    "gesture": row[0],
+                    "count": row[1],
+                    "accuracy": round(float(row[2]) * 100, 2) if row[2] else 0.0,
+                    "avg_confidence": round(float(row[3]) * 100, 2) if row[3] else 0.0,
+                    "avg_response_time": round(float(row[4]), 2) if row[4] else 0.0,
+                    "min_response_time": round(float(row[5]), 2) if row[5] else 0.0,
+                    "max_response_time": round(float(row[6]), 2) if row[6] else 0.0,
+                    "percentage": round(row[7], 2),
+                }
+                results.append(gesture_data)
+                total_all += row[1]
         
-        return {
+        return ORJSONResponse({
             "gestures": results,
             "total_count": total_all,
             "timestamp": datetime.now().isoformat()
-        }
+        })
     
     except Exception as e:
         logger.error(f"获取手势分析失败: {e}")
@@ -577,55 +897,56 @@ async def get_gesture_analytics():
 
 
 @app.get("/api/analytics/timeline")
+@analytics_cached
 async def get_timeline_analytics(hours: int = 24):
     """
     获取时间线数据
     参数：hours - 统计最近几小时的数据（默认24小时）
-    返回：按小时统计的识别次数
+    返回：按小时统计的识别次数；hour_bucket 按UTC整点划分，datetime 标签同样为UTC时间
     """
     try:
         hours = max(1, min(168, hours))  # 限制在1-168小时（7天）
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 计算时间范围
-        end_time = time.time()
-        start_time = end_time - (hours * 3600)
-        
-        # 按小时分组统计
-        cursor.execute("""
-            SELECT 
-                CAST((time - ?) / 3600 AS INTEGER) as hour_bucket,
-                COUNT(*) as count,
-                AVG(score) as avg_confidence,
-                AVG(response_time) as avg_response_time
-            FROM logs
-            WHERE time >= ? AND time <= ?
-            GROUP BY hour_bucket
-            ORDER BY hour_bucket
-        """, (start_time, start_time, end_time))
-        
-        results = []
-        for row in cursor.fetchall():
-            hour_offset = row[0]
-            timestamp = start_time + (hour_offset * 3600)
-            results.append({
-                "timestamp": int(timestamp),
-                "datetime": datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:00"),
-                "count": row[1],
-                "avg_confidence": round(float(row[2]) * 100, 2) if row[2] else 0.0,
-                "avg_response_time": round(float(row[3]), 2) if row[3] else 0.0
-            })
-        
-        conn.close()
+        async with app.state.db_pool.connection() as conn:
+            # 计算时间范围：包含当前小时在内的最近 hours 个整点小时
+            end_time = time.time()
+            end_bucket = int(end_time // 3600)
+            start_bucket = end_bucket - hours + 1
+            start_time = start_bucket * 3600
+            
+            # 按小时分组统计：hour_bucket 为带索引的生成列，按索引顺序范围扫描并分组；
+            # SQLite不把虚拟生成列上的索引当作覆盖索引，score/response_time 仍需回表读取
+            cursor = await conn.execute("""
+                SELECT 
+                    hour_bucket,
+                    COUNT(*) as count,
+                    AVG(score) as avg_confidence,
+                    AVG(response_time) as avg_response_time
+                FROM logs
+                WHERE hour_bucket BETWEEN ? AND ?
+                GROUP BY hour_bucket
+                ORDER BY hour_bucket
+            """, (start_bucket, end_bucket))
+            
+            results = []
+            for row in await cursor.fetchall():
+                timestamp = row[0] * 3600
+                results.append({
+                    "timestamp": int(timestamp),
+                    # 直接用 time.strftime 格式化，不为每个时间桶构造 datetime 对象；
+                    # 桶按UTC整点划分，用本地时间显示在非整点时区（如+05:30）会与 ":00" 标签错位
+                    "datetime": time.strftime("%Y-%m-%d %H:00", time.gmtime(timestamp)),
+                    "count": row[1],
+                    "avg_confidence": round(float(row[2]) * 100, 2) if row[2] else 0.0,
+                    "avg_response_time": round(float(row[3]), 2) if row[3] else 0.0
+                })
         
-        return {
+        return ORJSONResponse({
             "timeline": results,
             "hours": hours,
             "start_time": int(start_time),
             "end_time": int(end_time)
-        }
+        })
     
     except Exception as e:
         logger.error(f"获取时间线分析失败: {e}")
@@ -633,92 +954,89 @@ async def get_timeline_analytics(hours: int = 24):
 
 
 @app.get("/api/analytics/accuracy")
+@analytics_cached
 async def get_accuracy_analytics():
     """
     获取准确率分析
     返回：每个手势的准确率、错误类型分析
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 1. 每个手势的准确率
-        cursor.execute("""
-            SELECT 
-                gesture,
-                COUNT(*) as total,
-                SUM(is_correct) as correct,
-                AVG(score) as avg_confidence
-            FROM logs
-            WHERE gesture != 'UNKNOWN'
-            GROUP BY gesture
-        """)
-        
-        gesture_accuracy = []
-        for row in cursor.fetchall():
-            total = row[1]
-            correct = row[2]
-            accuracy = (correct / total * 100) if total > 0 else 0.0
+        async with app.state.db_pool.connection() as conn:
+            # 1. 每个手势的准确率
+            cursor = await conn.execute("""
+                SELECT 
+                    gesture,
+                    COUNT(*) as total,
+                    SUM(is_correct) as correct,
+                    AVG(score) as avg_confidence
+                FROM logs
+                WHERE gesture != 'UNKNOWN'
+                GROUP BY gesture
+            """)
             
-            gesture_accuracy.append({
-                "gesture": row[0],
-                "total": total,
-                "correct": correct,
-                "incorrect": total - correct,
-                "accuracy": round(accuracy, 2),
-                "avg_confidence": round(float(row[3]) * 100, 2) if row[3] else 0.0
-            })
-        
-        # 2. 置信度分布（分组统计）
-        cursor.execute("""
-            SELECT 
-                CASE 
-                    WHEN score >= 0.9 THEN '90-100%'
-                    WHEN score >= 0.8 THEN '80-90%'
-                    WHEN score >= 0.7 THEN '70-80%'
-                    WHEN score >= 0.6 THEN '60-70%'
-                    ELSE '<60%'
-                END as confidence_range,
-                COUNT(*) as count
-            FROM logs
-            GROUP BY confidence_range
-            ORDER BY confidence_range DESC
-        """)
-        
-        confidence_distribution = [
-            {"range": row[0], "count": row[1]} 
-            for row in cursor.fetchall()
-        ]
-        
-        # 3. 响应时间分布
-        cursor.execute("""
-            SELECT 
-                CASE 
-                    WHEN response_time < 50 THEN '<50ms'
-                    WHEN response_time < 100 THEN '50-100ms'
-                    WHEN response_time < 200 THEN '100-200ms'
-                    WHEN response_time < 500 THEN '200-500ms'
-                    ELSE '>500ms'
-                END as response_range,
-                COUNT(*) as count
-            FROM logs
-            WHERE response_time > 0
-            GROUP BY response_range
-        """)
-        
-        response_distribution = [
-            {"range": row[0], "count": row[1]} 
-            for row in cursor.fetchall()
-        ]
-        
-        conn.close()
+            gesture_accuracy = []
+            for row in await cursor.fetchall():
+                total = row[1]
+                correct = row[2]
+                accuracy = (correct / total * 100) if total > 0 else 0.0
+                
+                gesture_accuracy.append({
+                    "gesture": row[0],
+                    "total": total,
+                    "correct": correct,
+                    "incorrect": total - correct,
+                    "accuracy": round(accuracy, 2),
+                    "avg_confidence": round(float(row[3]) * 100, 2) if row[3] else 0.0
+                })
+            
+            # 2. 置信度分布（整数桶号，区间名在Python中映射）
+            # 直接比较原始score：score*10 取整会把 0.8999999999999999 之类的浮点值进位到上一档
+            cursor = await conn.execute("""
+                SELECT 
+                    CASE 
+                        WHEN score >= 0.9 THEN 9
+                        WHEN score >= 0.8 THEN 8
+                        WHEN score >= 0.7 THEN 7
+                        WHEN score >= 0.6 THEN 6
+                        ELSE 5
+                    END as bucket,
+                    COUNT(*) as count
+                FROM logs
+                GROUP BY bucket
+                ORDER BY bucket DESC
+            """)
+            
+            confidence_distribution = [
+                {"range": CONFIDENCE_BUCKET_LABELS[row[0]], "count": row[1]} 
+                for row in await cursor.fetchall()
+            ]
+            
+            # 3. 响应时间分布（按50ms分桶，相邻桶合并为不等宽区间）
+            cursor = await conn.execute("""
+                SELECT 
+                    MIN(CAST(response_time / 50 AS INTEGER), 10) as bucket,
+                    COUNT(*) as count
+                FROM logs
+                WHERE response_time > 0
+                GROUP BY bucket
+                ORDER BY bucket
+            """)
+            
+            response_counts: Dict[str, int] = {}
+            for row in await cursor.fetchall():
+                label = RESPONSE_BUCKET_LABELS[row[0]]
+                response_counts[label] = response_counts.get(label, 0) + row[1]
+            response_distribution = [
+                {"range": label, "count": count}
+                for label, count in response_counts.items()
+            ]
         
-        return {
+        return ORJSONResponse({
             "gesture_accuracy": gesture_accuracy,
             "confidence_distribution": confidence_distribution,
             "response_distribution": response_distribution,
             "timestamp": datetime.now().isoformat()
-        }
+        })
     
     except Exception as e:
         logger.error(f"获取准确率分析失败: {e}")
@@ -732,45 +1050,41 @@ async def get_performance_metrics():
     返回：响应时间统计、FPS统计、系统负载
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 响应时间统计
-        cursor.execute("""
-            SELECT 
-                AVG(response_time) as avg_time,
-                MIN(response_time) as min_time,
-                MAX(response_time) as max_time,
-                COUNT(*) as sample_count
-            FROM logs
-            WHERE response_time > 0
-        """)
-        row = cursor.fetchone()
-        
-        response_stats = {
-            "avg_response_time": round(float(row[0]), 2) if row[0] else 0.0,
-            "min_response_time": round(float(row[1]), 2) if row[1] else 0.0,
-            "max_response_time": round(float(row[2]), 2) if row[2] else 0.0,
-            "sample_count": row[3]
-        }
-        
-        # 最近1小时的响应时间趋势
-        one_hour_ago = time.time() - 3600
-        cursor.execute("""
-            SELECT AVG(response_time), COUNT(*)
-            FROM logs
-            WHERE time > ? AND response_time > 0
-        """, (one_hour_ago,))
-        row = cursor.fetchone()
-        
-        recent_stats = {
-            "recent_avg_response_time": round(float(row[0]), 2) if row[0] else 0.0,
-            "recent_sample_count": row[1]
-        }
-        
-        conn.close()
+        async with app.state.db_pool.connection() as conn:
+            # 响应时间统计
+            cursor = await conn.execute("""
+                SELECT 
+                    AVG(response_time) as avg_time,
+                    MIN(response_time) as min_time,
+                    MAX(response_time) as max_time,
+                    COUNT(*) as sample_count
+                FROM logs
+                WHERE response_time > 0
+            """)
+            row = await cursor.fetchone()
+            
+            response_stats = {
+                "avg_response_time": round(float(row[0]), 2) if row[0] else 0.0,
+                "min_response_time": round(float(row[1]), 2) if row[1] else 0.0,
+                "max_response_time": round(float(row[2]), 2) if row[2] else 0.0,
+                "sample_count": row[3]
+            }
+            
+            # 最近1小时的响应时间趋势
+            one_hour_ago = time.time() - 3600
+            cursor = await conn.execute("""
+                SELECT AVG(response_time), COUNT(*)
+                FROM logs
+                WHERE time > ? AND response_time > 0
+            """, (one_hour_ago,))
+            row = await cursor.fetchone()
+            
+            recent_stats = {
+                "recent_avg_response_time": round(float(row[0]), 2) if row[0] else 0.0,
+                "recent_sample_count": row[1]
+            }
         
-        return {
+        return ORJSONResponse({
             "response_time": response_stats,
             "recent_performance": recent_stats,
             "system_uptime": round(app_state.get_uptime(), 2),
@@ -778,19 +1092,284 @@ async def get_performance_metrics():
             "error_count": app_state.error_count,
             "avg_fps": round(app_state.get_avg_fps(), 2),
             "timestamp": datetime.now().isoformat()
-        }
+        })
     
     except Exception as e:
         logger.error(f"获取性能指标失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ==================== 输出文件轮转 ====================
+# 按写入顺序记录每组输出的路径（处理图，及可选的原图），超过上限时删除最早的一组
+_output_files: deque = deque()
+
+
+def load_output_files():
+    """启动时按修改时间恢复已有的输出文件记录"""
+    try:
+        entries = [
+            entry for entry in os.scandir(settings.output_dir)
+            if entry.is_file() and entry.name.endswith("_proc.jpg")
+        ]
+    except FileNotFoundError:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in entries:
+        # 原图可能未保存，删除时按不存在处理
+        orig_path = entry.path[:-len("_proc.jpg")] + "_orig.jpg"
+        _output_files.append((orig_path, entry.path))
+
+
+def _pop_expired_outputs() -> List[str]:
+    """取出超出上限的旧文件路径"""
+    expired = []
+    while len(_output_files) > settings.max_output_files:
+        expired.extend(_output_files.popleft())
+    return expired
+
+
+def _remove_files(paths: List[str]):
+    """删除文件（在工作线程中执行）"""
+    for path in paths:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"删除输出文件失败 {path}: {e}")
+
+
+async def rotate_output_files(orig_path: Optional[str] = None, proc_path: Optional[str] = None):
+    """登记新写入的输出文件（orig_path 可为空），并删除超出上限的旧文件"""
+    if proc_path:
+        _output_files.append((orig_path, proc_path) if orig_path else (proc_path,))
+    expired = _pop_expired_outputs()
+    if expired:
+        await asyncio.to_thread(_remove_files, expired)
+
+
 # ==================== OpenCV预处理端点 ====================
+# JPEG编码参数：质量85，关闭哈夫曼表优化以缩短编码时间
+JPEG_WRITE_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, 85, cv2.IMWRITE_JPEG_OPTIMIZE, 0]
+
+
+# CLAHE参数固定，全局复用同一实例，避免每次请求重新分配直方图与查找表。
+# apply() 不保留帧间状态；若参数需要动态调整，可按 (clipLimit, tileGridSize) 缓存多个实例
+_CLAHE = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+
+# CUDA滤波器（启动时检测到CUDA设备才创建），为None时走OpenCL/CPU路径
+_cuda_pipeline: Optional[Dict[str, Any]] = None
+# CLAHE与CUDA滤波器对象内部复用缓冲区，不可被多个工作线程同时调用
+_FILTER_LOCK = threading.Lock()
+
+
+def init_cuda_pipeline():
+    """检测CUDA设备，可用时预先创建GPU上的模糊、CLAHE与Canny算子"""
+    global _cuda_pipeline
+    # pip版opencv-python不含CUDA模块，只有自行编译的CUDA版本才提供这些算子
+    if not settings.use_cuda or not hasattr(cv2.cuda, "createCannyEdgeDetector"):
+        return
+    try:
+        if cv2.cuda.getCudaEnabledDeviceCount() <= 0:
+            return
+        _cuda_pipeline = {
+            "blur": cv2.cuda.createGaussianFilter(cv2.CV_8UC1, cv2.CV_8UC1, (5, 5), 0),
+            "clahe": cv2.cuda.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)),
+            "canny": cv2.cuda.createCannyEdgeDetector(60, 140),
+            "stream": cv2.cuda.Stream(),
+        }
+        logger.info("OpenCV CUDA加速: 启用")
+    except cv2.error as e:
+        _cuda_pipeline = None
+        logger.warning(f"CUDA初始化失败，回退到OpenCL/CPU: {e}")
+
+
+def _edges_cuda(resized: np.ndarray) -> np.ndarray:
+    """GPU路径：上传一次，灰度→模糊→CLAHE→Canny全部在显存中完成，最后下载一次"""
+    stream = _cuda_pipeline["stream"]
+    gpu = cv2.cuda_GpuMat()
+    gpu.upload(resized, stream)
+    gray = cv2.cuda.cvtColor(gpu, cv2.COLOR_BGR2GRAY, stream=stream)
+    blurred = _cuda_pipeline["blur"].apply(gray, stream=stream)
+    enhanced = _cuda_pipeline["clahe"].apply(blurred, stream)
+    edges = _cuda_pipeline["canny"].detect(enhanced, stream=stream)
+    result = edges.download(stream)
+    stream.waitForCompletion()
+    return result
+
+
+def _edges_umat(resized: np.ndarray) -> np.ndarray:
+    """OpenCL/CPU路径：滤波链走OpenCV T-API，有可用OpenCL设备时在GPU上执行"""
+    gray = cv2.cvtColor(cv2.UMat(resized), cv2.COLOR_BGR2GRAY)
+    # 原地模糊，复用灰度图缓冲区
+    cv2.GaussianBlur(gray, (5, 5), 0, dst=gray)
+    enhanced = _CLAHE.apply(gray)
+    return cv2.Canny(enhanced, 60, 140).get()
+
+
+# 预处理输出宽度
+PREPROCESS_WIDTH = 640
+# JPEG按DCT缩小解码的倍数及对应标志，从大到小尝试
+_REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def _jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """从JPEG的SOF段读取 (宽, 高)，不解码像素；非JPEG或解析失败返回None"""
+    if data[:2] != b"\xff\xd8":
+        return None
+    i, n = 2, len(data)
+    while i + 9 < n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            # 填充字节
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # 无长度字段的独立标记
+            i += 2
+            continue
+        # SOF0~SOF15（排除DHT/JPG/DAC）：长度(2) 精度(1) 高(2) 宽(2)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = int.from_bytes(data[i + 5:i + 7], "big")
+            width = int.from_bytes(data[i + 7:i + 9], "big")
+            return width, height
+        i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+    return None
+
+
+def _downscale(img: np.ndarray, new_size: Tuple[int, int]) -> np.ndarray:
+    """
+    缩放到 new_size (宽, 高)：非整数倍且缩小2倍及以上时先用 pyrDown 逐级减半，再以 INTER_LINEAR 缩放到目标尺寸；
+    整数倍缩小（INTER_AREA 对此有快速路径）、不足2倍的缩小和放大仍使用 INTER_AREA
+    """
+    w, h = img.shape[1], img.shape[0]
+    if w < 2 * new_size[0] or (w % new_size[0] == 0 and h == new_size[1] * (w // new_size[0])):
+        return cv2.resize(img, new_size, interpolation=cv2.INTER_AREA)
+    while img.shape[1] >= 2 * new_size[0]:
+        img = cv2.pyrDown(img)
+    if (img.shape[1], img.shape[0]) == new_size:
+        return img
+    return cv2.resize(img, new_size, interpolation=cv2.INTER_LINEAR)
+
+
+def _decode_frame(contents: bytes, full: bool) -> Tuple[Optional[np.ndarray], Tuple[int, int]]:
+    """
+    解码上传的图像，返回 (图像, 原始(高, 宽))
+    JPEG宽度至少为输出宽度的2倍时按 1/2、1/4、1/8 缩小解码，libjpeg跳过高频DCT系数，
+    解码耗时和后续缩放的像素量都随之减少；需要保存原图时(full=True)始终全尺寸解码
+    """
+    arr = np.frombuffer(contents, dtype=np.uint8)
+    size = None if full else _jpeg_size(contents)
+    if size is not None:
+        w, h = size
+        for factor, flag in _REDUCED_DECODE_FLAGS:
+            if w // factor < PREPROCESS_WIDTH:
+                continue
+            img = cv2.imdecode(arr, flag)
+            # EXIF方向旋转后宽度可能不足，此时回退到全尺寸解码
+            if img is not None and img.shape[1] >= PREPROCESS_WIDTH:
+                if (img.shape[1] > img.shape[0]) != (w > h):
+                    w, h = h, w
+                return img, (h, w)
+            break
+    
+    img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+    if img is None:
+        return None, (0, 0)
+    return img, img.shape[:2]
+
+
+def _process_frame(
+    contents: bytes, full: bool
+) -> Optional[Tuple[np.ndarray, np.ndarray, Tuple[int, int], Tuple[int, int]]]:
+    """
+    解码→缩放→边缘检测，CPU密集，由端点放到工作线程中执行，避免阻塞事件循环
+    返回 (解码图像, 边缘图, 原始(高, 宽), 输出(宽, 高))，无法解码时返回None
+    """
+    img, (h, w) = _decode_frame(contents, full)
+    if img is None:
+        return None
+    
+    scale = PREPROCESS_WIDTH / max(w, 1)
+    new_size = (int(w * scale), int(h * scale))
+    # 先在解码结果上缩放，只把缩放后的小图交给GPU，避免每次请求复制一份全分辨率图像
+    resized = _downscale(img, new_size)
+    
+    # 边缘图为单通道，直接保存为灰度JPEG，无需再扩展为BGR
+    with _FILTER_LOCK:
+        if _cuda_pipeline is not None:
+            edges = _edges_cuda(resized)
+        else:
+            edges = _edges_umat(resized)
+    return img, edges, (h, w), new_size
+
+
+class _OutputName:
+    """输出文件名生成状态：时间前缀按秒缓存，序号全局自增"""
+    seq = itertools.count()
+    sec: int = -1
+    prefix: str = ""
+
+
+def next_output_base() -> str:
+    """生成输出文件名主干：时间前缀每秒只格式化一次，自增序号保证同一秒内不重名"""
+    sec = int(time.time())
+    if sec != _OutputName.sec:
+        _OutputName.prefix = time.strftime("%Y%m%d_%H%M%S", time.localtime(sec))
+        _OutputName.sec = sec
+    return f"{_OutputName.prefix}_{next(_OutputName.seq):06d}"
+
+
+def _write_jpeg(path: str, img: np.ndarray):
+    """
+    内存中编码JPEG后一次写入文件
+    imencode 释放GIL且不受 imwrite 在Windows上不支持非ASCII路径的限制
+    """
+    ok, buf = cv2.imencode(".jpg", img, JPEG_WRITE_PARAMS)
+    if not ok:
+        raise RuntimeError(f"JPEG编码失败: {path}")
+    with open(path, "wb") as f:
+        f.write(buf)
+
+
+def _save_images(orig_path: Optional[str], img: np.ndarray, proc_path: str, processed: np.ndarray):
+    """保存处理结果及可选的原图（在工作线程中执行）"""
+    if orig_path:
+        _write_jpeg(orig_path, img)
+    _write_jpeg(proc_path, processed)
+
+
+async def _write_outputs(orig_path: Optional[str], img: np.ndarray, proc_path: str, processed: np.ndarray):
+    """后台任务：响应返回后再编码写盘，并登记输出文件轮转"""
+    try:
+        await asyncio.to_thread(_save_images, orig_path, img, proc_path, processed)
+        await rotate_output_files(orig_path, proc_path)
+    except Exception as e:
+        logger.error(f"保存预处理结果失败: {e}")
+        app_state.error_count += 1
+
+
 @app.post("/api/frame/preprocess")
-async def preprocess_frame(file: UploadFile = File(...)):
-    """图像预处理端点"""
+async def preprocess_frame(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    save: bool = True,
+    save_original: bool = False,
+):
+    """
+    图像预处理端点
+    save=false 时只返回处理信息，不落盘；原图默认不保存，save_original=true 时一并写入
+    文件在响应返回后由后台任务写入，返回的路径可能稍后才可读取
+    """
     try:
-        contents = await file.read()
+        # 最多读取 max_file_size+1 字节，超限即拒绝，避免把超大上传整体读入内存
+        contents = await file.read(settings.max_file_size + 1)
         
         if len(contents) > settings.max_file_size:
             raise HTTPException(
@@ -798,42 +1377,34 @@ async def preprocess_frame(file: UploadFile = File(...)):
                 detail=f"文件过大"
             )
         
-        arr = np.frombuffer(contents, dtype=np.uint8)
-        img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        result = await asyncio.to_thread(_process_frame, contents, save and save_original)
         
-        if img is None:
+        if result is None:
             raise HTTPException(status_code=400, detail="无法解码图像")
+        img, edges, (h, w), new_size = result
         
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        ms = int((time.time() * 1000) % 1000)
-        base_name = f"{timestamp}_{ms}"
-        
-        orig_path = os.path.join(settings.output_dir, f"{base_name}_orig.jpg")
-        proc_path = os.path.join(settings.output_dir, f"{base_name}_proc.jpg")
-        
-        cv2.imwrite(orig_path, img)
-        
-        h, w = img.shape[:2]
-        target_w = 640
-        scale = target_w / max(w, 1)
-        new_size = (int(w * scale), int(h * scale))
-        resized = cv2.resize(img, new_size, interpolation=cv2.INTER_AREA)
-        
-        gray = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        enhanced = clahe.apply(blurred)
-        edges = cv2.Canny(enhanced, 60, 140)
-        processed = cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR)
-        cv2.imwrite(proc_path, processed)
+        orig_file = proc_file = None
+        if save:
+            base_name = next_output_base()
+            
+            orig_path = None
+            if save_original:
+                orig_path = os.path.join(settings.output_dir, f"{base_name}_orig.jpg")
+            proc_path = os.path.join(settings.output_dir, f"{base_name}_proc.jpg")
+            
+            # JPEG编码与写盘推迟到响应之后，在工作线程中执行
+            background_tasks.add_task(_write_outputs, orig_path, img, proc_path, edges)
+            if orig_path:
+                orig_file = orig_path.replace("\\", "/")
+            proc_file = proc_path.replace("\\", "/")
         
-        await insert_log_async(time.time(), "FRAME", "PREPROCESS", 1.0)
+        enqueue_log(time.time(), "FRAME", "PREPROCESS", 1.0)
         
         return {
             "ok": True,
             "pipeline": "resize → gray → gaussian → clahe → canny",
-            "original_file": orig_path.replace("\\", "/"),
-            "processed_file": proc_path.replace("\\", "/"),
+            "original_file": orig_file,
+            "processed_file": proc_file,
             "original_size": [h, w],
             "processed_size": [new_size[1], new_size[0]],
         }
@@ -848,13 +1419,13 @@ async def preprocess_frame(file: UploadFile = File(...)):
 @app.get("/api/stats")
 async def get_statistics():
     """获取统计信息"""
-    return {
+    return ORJSONResponse({
         "total_requests": app_state.total_requests,
         "error_count": app_state.error_count,
         "uptime_seconds": app_state.get_uptime(),
         "avg_fps": app_state.get_avg_fps(),
         "total_logs": get_log_count(),
-    }
+    })
 
 
 # ==================== 启动配置 ====================
@@ -22,9 +22,11 @@ def upgrade_database():
     
     # 备份数据库
     backup_path = f"gesture_logs_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
+    backed_up = False
     try:
         import shutil
         shutil.copy2(DB_PATH, backup_path)
+        backed_up = True
         print(f"✅ 数据库已备份到: {backup_path}")
     except Exception as e:
         print(f"⚠️  备份失败，但继续升级: {e}")
@@ -37,59 +39,64 @@ def upgrade_database():
     columns = [col[1] for col in cursor.fetchall()]
     print(f"\n当前字段: {', '.join(columns)}")
     
+    # 先收集需要执行的DDL，最后在同一个事务中一次提交（每条DDL单独提交都要各自落盘一次）
+    ddl = []
+    
     # 1. 添加 response_time 字段（响应时间，单位ms）
     if 'response_time' not in columns:
-        print("\n[1/4] 添加 response_time 字段...")
-        try:
-            cursor.execute("ALTER TABLE logs ADD COLUMN response_time REAL DEFAULT 0.0")
-            print("✅ response_time 字段添加成功")
-        except Exception as e:
-            print(f"⚠️  response_time 字段可能已存在: {e}")
+        print("\n[1/5] 待添加 response_time 字段")
+        ddl.append("ALTER TABLE logs ADD COLUMN response_time REAL DEFAULT 0.0")
     else:
-        print("\n[1/4] ✓ response_time 字段已存在")
+        print("\n[1/5] ✓ response_time 字段已存在")
     
     # 2. 添加 session_id 字段（会话ID）
     if 'session_id' not in columns:
-        print("\n[2/4] 添加 session_id 字段...")
-        try:
-            cursor.execute("ALTER TABLE logs ADD COLUMN session_id TEXT DEFAULT 'default'")
-            print("✅ session_id 字段添加成功")
-        except Exception as e:
-            print(f"⚠️  session_id 字段可能已存在: {e}")
+        print("\n[2/5] 待添加 session_id 字段")
+        ddl.append("ALTER TABLE logs ADD COLUMN session_id TEXT DEFAULT 'default'")
     else:
-        print("\n[2/4] ✓ session_id 字段已存在")
+        print("\n[2/5] ✓ session_id 字段已存在")
     
     # 3. 添加 is_correct 字段（是否识别正确，用于准确率计算）
     if 'is_correct' not in columns:
-        print("\n[3/4] 添加 is_correct 字段...")
-        try:
-            cursor.execute("ALTER TABLE logs ADD COLUMN is_correct INTEGER DEFAULT 1")
-            print("✅ is_correct 字段添加成功")
-        except Exception as e:
-            print(f"⚠️  is_correct 字段可能已存在: {e}")
+        print("\n[3/5] 待添加 is_correct 字段")
+        ddl.append("ALTER TABLE logs ADD COLUMN is_correct INTEGER DEFAULT 1")
+    else:
+        print("\n[3/5] ✓ is_correct 字段已存在")
+    
+    # 4. 添加 created_at 字段（SQLite不允许ALTER TABLE添加非常量默认值，旧数据为空）
+    if 'created_at' not in columns:
+        print("\n[4/5] 待添加 created_at 字段")
+        ddl.append("ALTER TABLE logs ADD COLUMN created_at TIMESTAMP")
     else:
-        print("\n[3/4] ✓ is_correct 字段已存在")
+        print("\n[4/5] ✓ created_at 字段已存在")
     
-    # 4. 创建新索引以优化查询
-    print("\n[4/4] 创建/更新索引...")
+    # 5. 创建新索引以优化查询
+    print("\n[5/5] 待创建/更新索引")
+    ddl += [
+        "DROP INDEX IF EXISTS idx_logs_gesture",
+        "CREATE INDEX IF NOT EXISTS idx_logs_gesture_cov ON logs(gesture, is_correct, score, response_time)",
+        "CREATE INDEX IF NOT EXISTS idx_logs_time_cov ON logs(time, score, response_time)",
+        "CREATE INDEX IF NOT EXISTS idx_logs_session ON logs(session_id)",
+        "CREATE INDEX IF NOT EXISTS idx_logs_created_at ON logs(created_at)",
+        # 更新统计信息，让查询规划器选用新索引
+        "ANALYZE",
+    ]
+    
+    # 已有备份时升级期间关闭同步，中途断电可从备份恢复
+    if backed_up:
+        synchronous = cursor.execute("PRAGMA synchronous").fetchone()[0]
+        cursor.execute("PRAGMA synchronous=OFF")
     try:
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_logs_gesture 
-            ON logs(gesture)
-        """)
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_logs_session 
-            ON logs(session_id)
-        """)
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_logs_created_at 
-            ON logs(created_at)
-        """)
-        print("✅ 索引创建/更新成功")
+        conn.executescript("BEGIN IMMEDIATE;\n" + ";\n".join(ddl) + ";\nCOMMIT;")
+        print("\n✅ 字段与索引升级成功")
     except Exception as e:
-        print(f"⚠️  索引创建警告: {e}")
-    
-    conn.commit()
+        if conn.in_transaction:
+            conn.rollback()
+        print(f"\n❌ 升级失败，已回滚，数据库未作任何修改: {e}")
+        conn.close()
+        return False
+    if backed_up:
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
     
     # 验证升级
     print("\n" + "=" * 60)